@@ -1,5 +1,6 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, abort
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import chess
 import chess.pgn
 import io
@@ -7,7 +8,14 @@ import requests
 import os
 import json
 import platform
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import chess.polyglot
 from stockfish import Stockfish
+from broker import request_engine_search
+from engine_worker import search_position
 import google.generativeai as genai
 from dotenv import load_dotenv
 
@@ -31,11 +39,13 @@ else:
     stockfish_path = "stockfish"  # For Linux/Mac
     print(f"Using Unix-based Stockfish path: {stockfish_path}")
 
+STOCKFISH_DEPTH = 15
+
 try:
     print(f"Initializing Stockfish with path: {stockfish_path}")
     stockfish = Stockfish(path=stockfish_path)
-    stockfish.set_depth(15)  # Adjust depth based on performance needs
-    print(f"Stockfish initialized successfully with depth: 15")
+    stockfish.set_depth(STOCKFISH_DEPTH)  # Adjust depth based on performance needs
+    print(f"Stockfish initialized successfully with depth: {STOCKFISH_DEPTH}")
 except Exception as e:
     print(f"WARNING: Stockfish initialization error: {e}")
     print("You may need to update the stockfish_path to the correct location of your Stockfish executable")
@@ -43,6 +53,18 @@ except Exception as e:
     stockfish = None
     print("Using None as fallback for Stockfish")
 
+# The Stockfish wrapper drives a single engine process, so every caller
+# (request handlers and the puzzle pipeline) has to take turns
+stockfish_lock = threading.Lock()
+
+# When a broker address is set, searches go to the engine worker pool
+# (see broker.py and engine_worker.py) instead of the local engine
+ENGINE_BROKER_ADDRESS = os.environ.get("ENGINE_BROKER_ADDRESS")
+# Searches one request keeps in flight at once on the worker pool
+ENGINE_SEARCH_CONCURRENCY = int(os.environ.get("ENGINE_SEARCH_CONCURRENCY", 8))
+if ENGINE_BROKER_ADDRESS:
+    print(f"Engine searches will be sent to broker at {ENGINE_BROKER_ADDRESS}")
+
 # Configure Gemini API
 print("Configuring Gemini API...")
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
@@ -78,9 +100,34 @@ else:
 
 # No longer using OpenRouter API
 
+def engine_available():
+    return bool(ENGINE_BROKER_ADDRESS) or stockfish is not None
+
+
+def run_engine_search(fen, depth=STOCKFISH_DEPTH, multipv=1, evaluate=True):
+    """Run a search on the worker pool when a broker is configured, otherwise locally"""
+    if ENGINE_BROKER_ADDRESS:
+        job = {"fen": fen, "depth": depth, "multipv": multipv, "evaluate": evaluate}
+        return request_engine_search(ENGINE_BROKER_ADDRESS, job)
+
+    with stockfish_lock:
+        try:
+            return search_position(stockfish, fen, depth, multipv, evaluate)
+        finally:
+            stockfish.set_depth(STOCKFISH_DEPTH)
+
+
+def analyze_positions_with_stockfish(fens):
+    """Analyze many positions, spreading them across the worker pool when a broker is configured"""
+    if ENGINE_BROKER_ADDRESS:
+        with ThreadPoolExecutor(max_workers=ENGINE_SEARCH_CONCURRENCY) as executor:
+            return list(executor.map(analyze_position_with_stockfish, fens))
+    return [analyze_position_with_stockfish(fen) for fen in fens]
+
+
 def analyze_position_with_stockfish(fen):
     """Analyze a position with Stockfish"""
-    if stockfish is None:
+    if not engine_available():
         return {
             "evaluation": {"type": "cp", "value": 0},
             "best_move": "e2e4",
@@ -88,13 +135,11 @@ def analyze_position_with_stockfish(fen):
         }
     
     try:
-        stockfish.set_fen_position(fen)
-        evaluation = stockfish.get_evaluation()
-        best_move = stockfish.get_best_move()
+        result = run_engine_search(fen)
         
         return {
-            "evaluation": evaluation,
-            "best_move": best_move
+            "evaluation": result["evaluation"],
+            "best_move": result["best_move"]
         }
     except Exception as e:
         print(f"Stockfish analysis error: {e}")
@@ -356,31 +401,260 @@ When analyzing a chess position (FEN: {fen}), provide the following:
 # #         print(f"Traceback: {traceback.format_exc()}")
 # #         return error_msg
 
+# ---------------------------------------------------------------------------
+# PGN ingestion
+#
+# Uploads are parsed straight from the request stream one line at a time, so
+# memory stays flat whatever the upload size. Limits on bytes, games and moves
+# are checked while reading and the first problem is reported with its line.
+# ---------------------------------------------------------------------------
+
+MAX_PGN_BYTES = int(os.environ.get("MAX_PGN_BYTES", 2 * 1024 * 1024))
+MAX_PGN_GAMES = 500      # Games listed by a single headers scan
+MAX_GAME_PLIES = 600     # Moves in one game, variations included
+
+# Bodies that announce a larger Content-Length are refused before being read
+app.config['MAX_CONTENT_LENGTH'] = MAX_PGN_BYTES
+
+
+class PGNIngestError(Exception):
+    """Raised when an uploaded PGN breaks a limit or cannot be parsed"""
+
+    def __init__(self, message, status=400, line=None):
+        super().__init__(message)
+        self.status = status
+        self.line = line
+
+    def to_response(self):
+        body = {"error": str(self)}
+        if self.line is not None:
+            body["line"] = self.line
+        return jsonify(body), self.status
+
+
+class BoundedPGNReader:
+    """Text handle over a binary stream that enforces the byte limit, counts
+    lines and rejects malformed tag lines (python-chess silently drops them)"""
+
+    def __init__(self, stream, max_bytes=MAX_PGN_BYTES):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self.line_number = 0
+        self.in_comment = False
+
+    def readline(self):
+        # Never ask for more than one byte past the limit, even for a single huge line
+        try:
+            line = self.stream.readline(self.max_bytes - self.bytes_read + 1)
+        except RequestEntityTooLarge:
+            line = None
+        if line is not None:
+            self.bytes_read += len(line)
+        if line is None or self.bytes_read > self.max_bytes:
+            raise PGNIngestError(f"PGN upload exceeds {self.max_bytes} bytes", status=413,
+                                 line=self.line_number + 1)
+        if line:
+            self.line_number += 1
+        try:
+            text = line.decode("utf-8")
+        except UnicodeDecodeError:
+            raise PGNIngestError("PGN is not valid UTF-8", line=self.line_number)
+        self.check_line(text)
+        return text
+
+    def check_line(self, text):
+        content = text.lstrip("\ufeff")
+        if content.startswith("%") or content.startswith(";"):
+            return
+        if not self.in_comment and content.startswith("["):
+            if not chess.pgn.TAG_REGEX.match(content):
+                raise PGNIngestError(f"Malformed PGN tag: {content.strip()[:80]}", line=self.line_number)
+            return
+
+        # Track {...} comments so a comment line starting with "[" is not taken for a tag
+        for char in content:
+            if self.in_comment:
+                if char == "}":
+                    self.in_comment = False
+            elif char == "{":
+                self.in_comment = True
+            elif char == ";":
+                break
+
+
+class PGNLimitsMixin:
+    """Visitor checks shared by the full parse and the headers scan: stop at
+    the first illegal move, once a game gets too long, or on a game with
+    neither tags nor moves"""
+
+    def __init__(self, reader):
+        super().__init__()
+        self.reader = reader
+        self.plies = 0
+        self.tags = 0
+        self.start_line = None
+
+    def begin_game(self):
+        self.start_line = self.reader.line_number
+        super().begin_game()
+
+    def visit_header(self, tagname, tagvalue):
+        self.tags += 1
+        super().visit_header(tagname, tagvalue)
+
+    def visit_move(self, board, move):
+        self.plies += 1
+        if self.plies > MAX_GAME_PLIES:
+            raise PGNIngestError(f"Game has more than {MAX_GAME_PLIES} moves", line=self.reader.line_number)
+        super().visit_move(board, move)
+
+    def handle_error(self, error):
+        raise PGNIngestError(f"Invalid PGN: {error}", line=self.reader.line_number)
+
+    def end_game(self):
+        # python-chess skips text it does not recognise, so garbage parses as an empty game
+        if self.tags == 0 and self.plies == 0:
+            raise PGNIngestError("Invalid PGN: no tags or moves found", line=self.start_line)
+        super().end_game()
+
+
+class BoundedGameBuilder(PGNLimitsMixin, chess.pgn.GameBuilder):
+    """GameBuilder with the PGN ingestion limits"""
+
+
+class BoundedHeadersBuilder(PGNLimitsMixin, chess.pgn.HeadersBuilder):
+    """HeadersBuilder with the PGN ingestion limits.
+
+    Movetext is skipped once a game has tags; a game without tags has its
+    moves parsed so that text with neither is rejected like in analyze_pgn.
+    """
+
+    def end_headers(self):
+        return chess.pgn.SKIP if self.tags else None
+
+
+@app.before_request
+def reject_oversized_body():
+    # Most endpoints read request.json inside a catch-all try block, which would
+    # turn the 413 into a 500; refuse oversized bodies before the view runs.
+    # The PGN routes report the limit themselves through PGNIngestError.
+    if request.endpoint in ('analyze_pgn', 'scan_pgn'):
+        return None
+    if request.content_length is not None and request.content_length > MAX_PGN_BYTES:
+        abort(413)
+
+
+@app.errorhandler(413)
+def payload_too_large(e):
+    return jsonify({"error": f"Request body too large (limit {MAX_PGN_BYTES} bytes)"}), 413
+
+
+def open_pgn_upload():
+    """Reader over the uploaded PGN.
+
+    Raw bodies (e.g. Content-Type: application/x-chess-pgn) are streamed from
+    the request; the older {"pgn": "..."} JSON body is still accepted.
+    """
+    if request.content_length is not None and request.content_length > MAX_PGN_BYTES:
+        raise PGNIngestError(f"PGN upload exceeds {MAX_PGN_BYTES} bytes", status=413)
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('pgn', ''), str):
+            raise PGNIngestError("Request body must be a JSON object with a 'pgn' string")
+        return BoundedPGNReader(io.BytesIO(data.get('pgn', '').encode("utf-8")))
+    return BoundedPGNReader(request.stream)
+
+
+def read_pgn_game(reader, game_index=0):
+    """Skip to a game in the upload and parse only that one"""
+    if game_index < 0 or game_index >= MAX_PGN_GAMES:
+        raise PGNIngestError(f"Game index must be between 0 and {MAX_PGN_GAMES - 1}")
+
+    for skipped in range(game_index):
+        if not chess.pgn.skip_game(reader):
+            raise PGNIngestError(f"PGN contains only {skipped} game(s)")
+
+    game = chess.pgn.read_game(reader, Visitor=lambda: BoundedGameBuilder(reader))
+    if game is None:
+        raise PGNIngestError("No game found in PGN")
+    if game.errors:
+        raise PGNIngestError(f"Invalid PGN: {game.errors[0]}", line=reader.line_number)
+    return game
+
+
+@app.route('/api/scan_pgn', methods=['POST'])
+def scan_pgn():
+    """List the games in a PGN upload by reading their headers only"""
+    try:
+        reader = open_pgn_upload()
+        games = []
+        truncated = False
+        while True:
+            headers = chess.pgn.read_game(reader, Visitor=lambda: BoundedHeadersBuilder(reader))
+            if headers is None:
+                break
+            if len(games) >= MAX_PGN_GAMES:
+                # List the first MAX_PGN_GAMES games and stop reading
+                truncated = True
+                break
+
+            games.append({
+                "index": len(games),
+                "event": headers.get("Event", "Unknown Event"),
+                "date": headers.get("Date", "Unknown Date"),
+                "white": headers.get("White", "Unknown White"),
+                "black": headers.get("Black", "Unknown Black"),
+                "result": headers.get("Result", "*")
+            })
+
+        return jsonify({
+            "games": games,
+            "total_games": len(games),
+            "truncated": truncated
+        })
+
+    except PGNIngestError as e:
+        print(f"❌ PGN rejected: {e}")
+        return e.to_response()
+    except Exception as e:
+        error_msg = f"Error in scan_pgn: {str(e)}"
+        print(f"❌ ERROR: {error_msg}")
+        return jsonify({"error": error_msg}), 500
+
 @app.route('/api/analyze_pgn', methods=['POST'])
 def analyze_pgn():
     """Analyze a chess game from PGN format with detailed position analysis"""
-    data = request.json
-    pgn_str = data.get('pgn', '')
+    try:
+        game_index = int(request.args.get('game', 0))
+    except ValueError:
+        return jsonify({"error": "game must be an integer"}), 400
     
     try:
-        # Parse PGN
-        pgn = io.StringIO(pgn_str)
-        game = chess.pgn.read_game(pgn)
-        if not game:
-            return jsonify({"error": "Invalid PGN format"}), 400
+        # Parse the requested game straight from the upload
+        reader = open_pgn_upload()
+        game = read_pgn_game(reader, game_index)
         
         # Initialize analysis array and game state
         analysis = []
         board = game.board()
         moves = list(game.mainline_moves())
         
+        # Run the engine on every position up front so a worker pool can search them in parallel
+        fens = [board.fen()]
+        for move in moves:
+            board.push(move)
+            fens.append(board.fen())
+        stockfish_results = analyze_positions_with_stockfish(fens)
+        board = game.board()
+        
         # Store initial position
         analysis.append({
             "move_number": 0,
             "move_color": "Start",
             "move": "Initial position",
             "fen": board.fen(),
-            "stockfish": analyze_position_with_stockfish(board.fen()),
+            "stockfish": stockfish_results[0],
             "gemini": analyze_with_gemini(board.fen(), "Initial position")
         })
 
@@ -395,8 +669,8 @@ def analyze_pgn():
             # Get move context (last few moves)
             previous_moves = ' '.join(str(m) for m in list(board.move_stack)[-min(5, len(board.move_stack)):])
             
-            # Get Stockfish analysis for every position
-            stockfish_analysis = analyze_position_with_stockfish(fen)
+            # Stockfish analysis for every position
+            stockfish_analysis = stockfish_results[i + 1]
             
             # Get Gemini analysis for key positions
             gemini_analysis = ""
@@ -439,11 +713,17 @@ def analyze_pgn():
             "total_positions": len(analysis)
         }
         
+        # Hand the evaluated game to the background puzzle pipeline
+        enqueue_puzzle_extraction(game_info, analysis)
+        
         return jsonify({
             "game_info": game_info,
             "analysis": analysis
         })
     
+    except PGNIngestError as e:
+        print(f"❌ PGN rejected: {e}")
+        return e.to_response()
     except Exception as e:
         error_msg = f"Error in analyze_pgn: {str(e)}"
         print(f"❌ ERROR: {error_msg}")
@@ -505,8 +785,7 @@ def get_stockfish_move():
         return jsonify({"error": "FEN position required"}), 400
     
     try:
-        stockfish.set_fen_position(fen)
-        best_move = stockfish.get_best_move()
+        best_move = run_engine_search(fen, evaluate=False)["best_move"]
         
         return jsonify({
             "best_move": best_move
@@ -717,5 +996,375 @@ def get_move_analysis():
         error_msg = f"Error in get_move_analysis: {str(e)}"
         print(f"❌ ERROR: {error_msg}")
         return jsonify({"error": error_msg}), 500
+
+
+# ---------------------------------------------------------------------------
+# Puzzle extraction pipeline
+#
+# analyze_pgn already has an evaluation for every ply. Games are queued here
+# and a background thread looks for eval swings (blunders), verifies the
+# refutation with a short targeted search and stores the result as a puzzle.
+# Puzzles are deduplicated by Zobrist hash, so serving them is an indexed read.
+# ---------------------------------------------------------------------------
+
+PUZZLE_DB_PATH = os.environ.get("PUZZLE_DB_PATH", "puzzles.sqlite3")
+PUZZLE_QUEUE_SIZE = 1000
+PUZZLE_SEARCH_DEPTH = 12      # Short search used to verify and extend the line
+PUZZLE_SWING_THRESHOLD = 200  # Centipawns lost by the mover to count as a blunder
+PUZZLE_WIN_THRESHOLD = 150    # The refuting side must end up at least this much better
+PUZZLE_UNIQUE_MARGIN = 100    # Best move must beat the second best by this much
+PUZZLE_MAX_PLIES = 9          # Longest solution line we try to build
+MATE_SCORE = 10000
+
+PIECE_VALUES = {
+    chess.PAWN: 1,
+    chess.KNIGHT: 3,
+    chess.BISHOP: 3,
+    chess.ROOK: 5,
+    chess.QUEEN: 9,
+    chess.KING: 100,
+}
+
+PUZZLE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS puzzles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    position_hash TEXT NOT NULL UNIQUE,
+    fen TEXT NOT NULL,
+    solution TEXT NOT NULL,
+    themes TEXT NOT NULL,
+    white TEXT,
+    black TEXT,
+    event TEXT,
+    ply INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS puzzle_themes (
+    theme TEXT NOT NULL,
+    puzzle_id INTEGER NOT NULL REFERENCES puzzles(id),
+    PRIMARY KEY (theme, puzzle_id)
+);
+"""
+
+puzzle_queue = queue.Queue(maxsize=PUZZLE_QUEUE_SIZE)
+puzzle_worker_thread = None
+puzzle_worker_lock = threading.Lock()
+
+
+def init_puzzle_db():
+    """Create the puzzle tables once at startup"""
+    conn = sqlite3.connect(PUZZLE_DB_PATH, timeout=30)
+    try:
+        conn.executescript(PUZZLE_SCHEMA)
+    finally:
+        conn.close()
+
+
+def get_puzzle_db():
+    """Open a connection to the puzzle store"""
+    conn = sqlite3.connect(PUZZLE_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+try:
+    init_puzzle_db()
+    print(f"Puzzle store ready at {PUZZLE_DB_PATH}")
+except Exception as e:
+    print(f"WARNING: Could not initialize puzzle store at {PUZZLE_DB_PATH}: {e}")
+
+
+def position_hash(board):
+    """Zobrist hash of a position as a hex string (SQLite integers are signed)"""
+    return format(chess.polyglot.zobrist_hash(board), "016x")
+
+
+def evaluation_to_cp(evaluation, turn):
+    """Convert a Stockfish evaluation (White's point of view) to centipawns"""
+    if evaluation.get("type") == "mate":
+        mate = evaluation.get("value", 0)
+        if mate == 0:
+            # The side to move has been checkmated
+            return -MATE_SCORE if turn == chess.WHITE else MATE_SCORE
+        return MATE_SCORE - abs(mate) if mate > 0 else -(MATE_SCORE - abs(mate))
+    return evaluation.get("value", 0)
+
+
+def top_move_to_cp(top_move, color):
+    """Score of a get_top_moves entry from the point of view of color"""
+    if top_move.get("Mate") is not None:
+        mate = top_move["Mate"]
+        cp = MATE_SCORE - abs(mate) if mate > 0 else -(MATE_SCORE - abs(mate))
+    else:
+        cp = top_move.get("Centipawn") or 0
+    return cp if color == chess.WHITE else -cp
+
+
+def find_blunders(analysis):
+    """Find plies where the mover's evaluation dropped by a puzzle-worthy amount"""
+    blunders = []
+    for i in range(1, len(analysis)):
+        before = analysis[i - 1]
+        after = analysis[i]
+        if "error" in before["stockfish"] or "error" in after["stockfish"]:
+            continue
+        if after.get("is_game_over"):
+            continue
+
+        board_before = chess.Board(before["fen"])
+        board_after = chess.Board(after["fen"])
+        mover = board_before.turn
+        sign = 1 if mover == chess.WHITE else -1
+        cp_before = sign * evaluation_to_cp(before["stockfish"]["evaluation"], board_before.turn)
+        cp_after = sign * evaluation_to_cp(after["stockfish"]["evaluation"], board_after.turn)
+
+        # Skip positions that were already lost, and swings that leave the game balanced
+        if cp_before < -MATE_SCORE // 2:
+            continue
+        if cp_before - cp_after < PUZZLE_SWING_THRESHOLD or -cp_after < PUZZLE_WIN_THRESHOLD:
+            continue
+
+        blunders.append({
+            "ply": i,
+            "fen": after["fen"],
+            "blunder": after["move"],
+            "swing": cp_before - cp_after
+        })
+    return blunders
+
+
+def build_solution_line(fen):
+    """Verify and extend the refutation of a blunder with a short targeted search.
+
+    Returns the solution as a list of UCI moves, or None when the position does
+    not have a single clearly winning continuation for the side to move.
+    """
+    board = chess.Board(fen)
+    solver = board.turn
+    solution = []
+
+    while len(solution) < PUZZLE_MAX_PLIES and not board.is_game_over():
+        top_moves = run_engine_search(board.fen(), PUZZLE_SEARCH_DEPTH, multipv=2)["top_moves"]
+        if not top_moves:
+            break
+
+        if board.turn == solver:
+            best = top_move_to_cp(top_moves[0], solver)
+            if not solution and best < PUZZLE_WIN_THRESHOLD:
+                return None
+            if len(top_moves) > 1:
+                second = top_move_to_cp(top_moves[1], solver)
+                # The line stops being a puzzle once the solver has a real choice
+                if best - second < PUZZLE_UNIQUE_MARGIN and second < MATE_SCORE // 2:
+                    if not solution:
+                        return None
+                    break
+
+        move = chess.Move.from_uci(top_moves[0]["Move"])
+        board.push(move)
+        solution.append(move.uci())
+
+    # A puzzle always ends on one of the solver's moves
+    if len(solution) % 2 == 0:
+        solution = solution[:-1]
+    return solution or None
+
+
+def tag_puzzle_themes(fen, solution):
+    """Attach simple theme tags to a verified puzzle"""
+    board = chess.Board(fen)
+    first_move = chess.Move.from_uci(solution[0])
+    themes = []
+
+    if board.gives_check(first_move):
+        themes.append("check")
+    if board.is_capture(first_move):
+        themes.append("capture")
+    if first_move.promotion:
+        themes.append("promotion")
+
+    mover = board.piece_at(first_move.from_square)
+    board.push(first_move)
+    attacked = [
+        board.piece_at(square)
+        for square in board.attacks(first_move.to_square)
+        if board.piece_at(square) and board.piece_at(square).color == board.turn
+    ]
+    valuable = [p for p in attacked if PIECE_VALUES[p.piece_type] > PIECE_VALUES[mover.piece_type]]
+    forks_king = len(attacked) >= 2 and any(p.piece_type == chess.KING for p in attacked)
+    if not board.is_checkmate() and (len(valuable) >= 2 or forks_king):
+        themes.append("fork")
+
+    for uci in solution[1:]:
+        board.push(chess.Move.from_uci(uci))
+    if board.is_checkmate():
+        themes.append("mate")
+        themes.append(f"mateIn{(len(solution) + 1) // 2}")
+    else:
+        themes.append("advantage")
+
+    if len(solution) == 1:
+        themes.append("oneMove")
+    elif len(solution) <= 3:
+        themes.append("short")
+    else:
+        themes.append("long")
+    return themes
+
+
+def extract_puzzles_from_game(game_info, analysis):
+    """Run the whole pipeline for one analyzed game and store any new puzzles"""
+    stored = 0
+    conn = get_puzzle_db()
+    try:
+        for blunder in find_blunders(analysis):
+            board = chess.Board(blunder["fen"])
+            key = position_hash(board)
+            # Cheap dedupe before spending engine time on the position
+            if conn.execute("SELECT 1 FROM puzzles WHERE position_hash = ?", (key,)).fetchone():
+                continue
+
+            solution = build_solution_line(blunder["fen"])
+            if not solution:
+                continue
+            themes = tag_puzzle_themes(blunder["fen"], solution)
+
+            with conn:
+                cursor = conn.execute(
+                    """INSERT OR IGNORE INTO puzzles
+                       (position_hash, fen, solution, themes, white, black, event, ply)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (key, blunder["fen"], " ".join(solution), ",".join(themes),
+                     game_info.get("white"), game_info.get("black"),
+                     game_info.get("event"), blunder["ply"])
+                )
+                if cursor.rowcount:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO puzzle_themes (theme, puzzle_id) VALUES (?, ?)",
+                        [(theme, cursor.lastrowid) for theme in themes]
+                    )
+                    stored += 1
+    finally:
+        conn.close()
+    return stored
+
+
+def puzzle_worker():
+    """Background loop that drains the puzzle queue"""
+    print("Puzzle pipeline worker started")
+    while True:
+        game_info, analysis = puzzle_queue.get()
+        try:
+            stored = extract_puzzles_from_game(game_info, analysis)
+            print(f"Puzzle pipeline: {stored} new puzzle(s) from {game_info.get('white')} vs {game_info.get('black')}")
+        except Exception as e:
+            print(f"❌ Puzzle pipeline error: {e}")
+            import traceback
+            print(f"Traceback: {traceback.format_exc()}")
+        finally:
+            puzzle_queue.task_done()
+
+
+def enqueue_puzzle_extraction(game_info, analysis):
+    """Queue an analyzed game for puzzle extraction without blocking the request"""
+    global puzzle_worker_thread
+
+    if not engine_available():
+        return False
+
+    with puzzle_worker_lock:
+        if puzzle_worker_thread is None or not puzzle_worker_thread.is_alive():
+            puzzle_worker_thread = threading.Thread(target=puzzle_worker, daemon=True)
+            puzzle_worker_thread.start()
+
+    # Queue only what the pipeline reads, not the Gemini text and move context
+    plies = [
+        {
+            "fen": position["fen"],
+            "move": position["move"],
+            "stockfish": position["stockfish"],
+            "is_game_over": position.get("is_game_over", False)
+        }
+        for position in analysis
+    ]
+    source = {key: game_info.get(key) for key in ("white", "black", "event")}
+
+    try:
+        puzzle_queue.put_nowait((source, plies))
+        return True
+    except queue.Full:
+        print("WARNING: Puzzle queue is full, skipping puzzle extraction for this game")
+        return False
+
+
+def puzzle_row_to_dict(row):
+    return {
+        "id": row["id"],
+        "fen": row["fen"],
+        "solution": row["solution"].split(),
+        "themes": row["themes"].split(","),
+        "white": row["white"],
+        "black": row["black"],
+        "event": row["event"],
+        "ply": row["ply"]
+    }
+
+
+@app.route('/api/puzzles', methods=['GET'])
+def list_puzzles():
+    """List extracted puzzles, optionally filtered by theme"""
+    theme = request.args.get('theme', '')
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+
+    try:
+        conn = get_puzzle_db()
+        try:
+            if theme:
+                rows = conn.execute(
+                    """SELECT p.* FROM puzzle_themes t JOIN puzzles p ON p.id = t.puzzle_id
+                       WHERE t.theme = ? ORDER BY p.id LIMIT ? OFFSET ?""",
+                    (theme, limit, offset)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT * FROM puzzles ORDER BY id LIMIT ? OFFSET ?",
+                    (limit, offset)
+                ).fetchall()
+        finally:
+            conn.close()
+
+        return jsonify({
+            "puzzles": [puzzle_row_to_dict(row) for row in rows],
+            "pending_games": puzzle_queue.qsize()
+        })
+
+    except Exception as e:
+        error_msg = f"Error in list_puzzles: {str(e)}"
+        print(f"❌ ERROR: {error_msg}")
+        return jsonify({"error": error_msg}), 500
+
+
+@app.route('/api/puzzles/<int:puzzle_id>', methods=['GET'])
+def get_puzzle(puzzle_id):
+    """Get a single puzzle by id"""
+    try:
+        conn = get_puzzle_db()
+        try:
+            row = conn.execute("SELECT * FROM puzzles WHERE id = ?", (puzzle_id,)).fetchone()
+        finally:
+            conn.close()
+
+        if row is None:
+            return jsonify({"error": "Puzzle not found"}), 404
+        return jsonify(puzzle_row_to_dict(row))
+
+    except Exception as e:
+        error_msg = f"Error in get_puzzle: {str(e)}"
+        print(f"❌ ERROR: {error_msg}")
+        return jsonify({"error": error_msg}), 500
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,365 @@
+"""Engine broker: hands Stockfish searches from the web tier to worker processes.
+
+Messages are newline-delimited JSON over plain TCP, so everything can run on
+one machine:
+
+    python broker.py                 # start the broker
+    python engine_worker.py          # start as many workers as you like
+    ENGINE_BROKER_ADDRESS=127.0.0.1:5555 python app.py
+
+check_engine_workers.py runs a broker and several stub-engine workers on one
+machine to exercise the failure handling described below.
+
+Idle workers pull the next job from a shared queue, so a free worker always
+picks up work that would otherwise wait behind a busy one. Workers send
+heartbeats; a job is put back on the queue when its worker disconnects, stops
+heartbeating, holds it past the lease timeout or reports a failure.
+
+Searches fail fast instead of queueing when no worker is connected, and jobs
+still queued when the last worker goes away are failed back to the client, so
+the web tier degrades the same way it does without a local engine. While
+workers are connected but busy, jobs simply wait their turn.
+"""
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+BROKER_HOST = os.environ.get("ENGINE_BROKER_HOST", "127.0.0.1")
+BROKER_PORT = int(os.environ.get("ENGINE_BROKER_PORT", 5555))
+HEARTBEAT_INTERVAL = 2    # Seconds between worker heartbeats
+HEARTBEAT_TIMEOUT = 10    # Workers silent for this long are considered dead
+LEASE_TIMEOUT = 90        # Longest a single search may stay on one worker
+MAX_ATTEMPTS = 3          # Times a job is tried before the client gets an error
+JOB_TIMEOUT = 300         # Longest a client waits for a result, queueing included
+# Keep LEASE_TIMEOUT * MAX_ATTEMPTS below JOB_TIMEOUT so every retry can run out
+# its lease before the client gives up
+
+
+def send_message(sock, message, lock=None):
+    """Send one JSON message terminated by a newline"""
+    data = (json.dumps(message) + "\n").encode("utf-8")
+    if lock is None:
+        sock.sendall(data)
+    else:
+        with lock:
+            sock.sendall(data)
+
+
+def read_messages(sock):
+    """Yield JSON messages from a socket until the peer closes it"""
+    reader = sock.makefile("r", encoding="utf-8")
+    for line in reader:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def close_connection(conn):
+    """Close a socket even while a reader thread's makefile still holds it"""
+    try:
+        conn.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    conn.close()
+
+
+def parse_address(address):
+    """Split a "host:port" string"""
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def request_engine_search(address, job, timeout=JOB_TIMEOUT):
+    """Submit a search to the broker and block until a worker returns the result"""
+    # Leave the broker time to report its own timeout before giving up locally
+    with socket.create_connection(parse_address(address), timeout=timeout + 10) as sock:
+        send_message(sock, {"op": "submit", "job": job})
+        for message in read_messages(sock):
+            if message["op"] == "result":
+                return message["result"]
+            if message["op"] == "error":
+                raise RuntimeError(message["error"])
+    raise RuntimeError("Broker closed the connection before returning a result")
+
+
+class Broker:
+    """Job queue shared between clients and engine workers"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = deque()
+        self.jobs = {}
+        self.workers = {}
+        self.job_ids = itertools.count(1)
+
+    # --- clients ---------------------------------------------------------
+
+    def submit(self, job):
+        """Queue a job, or return None when there is no worker to run it"""
+        with self.lock:
+            if not self.workers:
+                return None
+            job_id = next(self.job_ids)
+            self.jobs[job_id] = {
+                "job": job,
+                "attempts": 0,
+                "worker": None,
+                "leased_at": None,
+                "result": None,
+                "error": None,
+                "done": threading.Event()
+            }
+            self.pending.append(job_id)
+            assignments = self.dispatch()
+        self.send_assignments(assignments)
+        return job_id
+
+    def wait(self, job_id, timeout):
+        entry = self.jobs[job_id]
+        finished = entry["done"].wait(timeout)
+        with self.lock:
+            self.jobs.pop(job_id, None)
+            if job_id in self.pending:
+                self.pending.remove(job_id)
+        if not finished:
+            return None, "Timed out waiting for an engine worker"
+        return entry["result"], entry["error"]
+
+    # --- workers ---------------------------------------------------------
+
+    def register(self, worker_id, conn, send_lock):
+        with self.lock:
+            previous = self.workers.pop(worker_id, None)
+            if previous is not None:
+                # The same id came back on a new connection; the old one is stale
+                print(f"Engine worker {worker_id} registered again, dropping its old connection")
+                if previous["job_id"] is not None:
+                    self.requeue(previous["job_id"], f"Worker {worker_id} reconnected")
+            self.workers[worker_id] = {
+                "conn": conn,
+                "send_lock": send_lock,
+                "last_heartbeat": time.monotonic(),
+                "idle": False,
+                "job_id": None
+            }
+            assignments = self.dispatch()
+        print(f"Engine worker {worker_id} registered ({len(self.workers)} connected)")
+        if previous is not None:
+            close_connection(previous["conn"])
+        self.send_assignments(assignments)
+
+    def heartbeat(self, worker_id, conn):
+        with self.lock:
+            worker = self.find_worker(worker_id, conn)
+            if worker is not None:
+                worker["last_heartbeat"] = time.monotonic()
+
+    def worker_ready(self, worker_id, conn):
+        with self.lock:
+            worker = self.find_worker(worker_id, conn)
+            if worker is None:
+                return
+            worker["idle"] = True
+            assignments = self.dispatch()
+        self.send_assignments(assignments)
+
+    def complete(self, worker_id, conn, job_id, result=None, error=None):
+        with self.lock:
+            worker = self.find_worker(worker_id, conn)
+            if worker is None:
+                return
+            if worker["job_id"] == job_id:
+                worker["job_id"] = None
+            entry = self.jobs.get(job_id)
+            # Ignore late answers for jobs that were already requeued elsewhere
+            if entry is None or entry["worker"] != worker_id:
+                return
+            entry["worker"] = None
+            if error is None:
+                entry["result"] = result
+                entry["done"].set()
+                return
+            print(f"Engine worker {worker_id} failed job {job_id}: {error}")
+            self.requeue(job_id, error)
+            assignments = self.dispatch()
+        self.send_assignments(assignments)
+
+    def remove_worker(self, worker_id, reason, conn=None):
+        """Remove a worker; with conn given, only if that is still its connection"""
+        with self.lock:
+            worker = self.find_worker(worker_id, conn)
+            if worker is None:
+                return
+            del self.workers[worker_id]
+            print(f"Engine worker {worker_id} removed: {reason}")
+            if worker["job_id"] is not None:
+                self.requeue(worker["job_id"], f"Worker {worker_id} lost: {reason}")
+            if not self.workers:
+                self.fail_pending("No engine workers connected")
+            assignments = self.dispatch()
+        close_connection(worker["conn"])
+        self.send_assignments(assignments)
+
+    def send_assignments(self, assignments):
+        """Send jobs picked by dispatch, outside the lock so a stalled socket
+        cannot freeze the broker"""
+        while assignments:
+            failed = []
+            for worker_id, conn, send_lock, job_id, message in assignments:
+                try:
+                    send_message(conn, message, send_lock)
+                except OSError:
+                    # The reader thread will notice the dead connection and clean up
+                    failed.append((worker_id, job_id))
+            if not failed:
+                return
+            with self.lock:
+                for worker_id, job_id in failed:
+                    worker = self.workers.get(worker_id)
+                    if worker is not None and worker["job_id"] == job_id:
+                        worker["job_id"] = None
+                    entry = self.jobs.get(job_id)
+                    if entry is not None and entry["worker"] == worker_id:
+                        entry["worker"] = None
+                        entry["leased_at"] = None
+                        entry["attempts"] -= 1
+                        self.pending.appendleft(job_id)
+                assignments = self.dispatch()
+
+    # --- internals (call with self.lock held) ----------------------------
+
+    def find_worker(self, worker_id, conn=None):
+        """Registration for worker_id, ignoring messages from a replaced connection"""
+        worker = self.workers.get(worker_id)
+        if worker is None or (conn is not None and worker["conn"] is not conn):
+            return None
+        return worker
+
+    def requeue(self, job_id, error):
+        entry = self.jobs.get(job_id)
+        if entry is None or entry["done"].is_set():
+            return
+        entry["worker"] = None
+        entry["leased_at"] = None
+        if entry["attempts"] >= MAX_ATTEMPTS:
+            entry["error"] = f"Search failed after {entry['attempts']} attempts: {error}"
+            entry["done"].set()
+        else:
+            self.pending.appendleft(job_id)
+
+    def fail_pending(self, error):
+        while self.pending:
+            entry = self.jobs.get(self.pending.popleft())
+            if entry is not None:
+                entry["error"] = error
+                entry["done"].set()
+
+    def dispatch(self):
+        """Lease pending jobs to idle workers; the caller sends them with
+        send_assignments once the lock is released"""
+        assignments = []
+        idle = [worker_id for worker_id, worker in self.workers.items() if worker["idle"]]
+        while self.pending and idle:
+            job_id = self.pending.popleft()
+            entry = self.jobs.get(job_id)
+            if entry is None:
+                continue
+            worker_id = idle.pop()
+            worker = self.workers[worker_id]
+            worker["idle"] = False
+            worker["job_id"] = job_id
+            entry["worker"] = worker_id
+            entry["leased_at"] = time.monotonic()
+            entry["attempts"] += 1
+            message = {"op": "job", "job_id": job_id, "job": entry["job"]}
+            assignments.append((worker_id, worker["conn"], worker["send_lock"], job_id, message))
+        return assignments
+
+    def check_workers(self):
+        """Drop silent workers and workers whose search overran its lease; their
+        jobs go back on the queue"""
+        now = time.monotonic()
+        with self.lock:
+            silent = [
+                (worker_id, worker["conn"]) for worker_id, worker in self.workers.items()
+                if now - worker["last_heartbeat"] > HEARTBEAT_TIMEOUT
+            ]
+            # A worker stuck in a search never asks for work again, so drop it;
+            # it reconnects with a fresh engine once the search returns
+            hung = [
+                (entry["worker"], self.workers[entry["worker"]]["conn"]) for entry in self.jobs.values()
+                if entry["worker"] in self.workers and now - entry["leased_at"] > LEASE_TIMEOUT
+            ]
+        for worker_id, conn in silent:
+            self.remove_worker(worker_id, "heartbeat timeout", conn)
+        for worker_id, conn in hung:
+            self.remove_worker(worker_id, "search overran its lease", conn)
+
+
+def handle_connection(broker, conn, address):
+    send_lock = threading.Lock()
+    worker_id = None
+    try:
+        for message in read_messages(conn):
+            op = message.get("op")
+            if op == "submit":
+                job_id = broker.submit(message["job"])
+                if job_id is None:
+                    send_message(conn, {"op": "error", "error": "No engine workers connected"}, send_lock)
+                    return
+                result, error = broker.wait(job_id, JOB_TIMEOUT)
+                if error is None:
+                    send_message(conn, {"op": "result", "result": result}, send_lock)
+                else:
+                    send_message(conn, {"op": "error", "error": error}, send_lock)
+                return
+            elif op == "register":
+                worker_id = message.get("worker_id") or f"{address[0]}:{address[1]}"
+                broker.register(worker_id, conn, send_lock)
+            elif worker_id is None:
+                send_message(conn, {"op": "error", "error": "Worker must register first"}, send_lock)
+                return
+            else:
+                broker.heartbeat(worker_id, conn)
+                if op == "ready":
+                    broker.worker_ready(worker_id, conn)
+                elif op == "done":
+                    broker.complete(worker_id, conn, message["job_id"], result=message["result"])
+                elif op == "failed":
+                    broker.complete(worker_id, conn, message["job_id"],
+                                    error=message.get("error", "unknown error"))
+    except (OSError, ValueError) as e:
+        print(f"Connection from {address[0]}:{address[1]} failed: {e}")
+    finally:
+        if worker_id is not None:
+            broker.remove_worker(worker_id, "disconnected", conn)
+        close_connection(conn)
+
+
+def monitor_workers(broker):
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        broker.check_workers()
+
+
+def serve(host=BROKER_HOST, port=BROKER_PORT, broker=None):
+    broker = broker or Broker()
+    threading.Thread(target=monitor_workers, args=(broker,), daemon=True).start()
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen()
+    print(f"Engine broker listening on {host}:{port}")
+
+    while True:
+        conn, address = server.accept()
+        threading.Thread(target=handle_connection, args=(broker, conn, address), daemon=True).start()
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,227 @@
+"""Check the engine broker with several workers on one machine.
+
+Starts a broker in this process and a few engine_worker processes that use a
+stub engine instead of Stockfish, then exercises the failure handling:
+
+    python check_engine_workers.py
+
+Exits with status 1 if any check fails.
+"""
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import broker
+import engine_worker
+
+WORKER_COUNT = 3
+LEASE_TIMEOUT = 2
+MARKER_DIR = tempfile.mkdtemp(prefix="engine-check-")
+
+
+class StubEngine:
+    """Stands in for Stockfish; the FEN string selects how a search behaves.
+
+    "fail" always raises, "flaky:<name>" fails once, "hang:<name>" overruns the
+    lease once, and anything else returns straight away.
+    """
+
+    def __init__(self, path=None):
+        self.fen = None
+
+    def set_depth(self, depth):
+        pass
+
+    def set_fen_position(self, fen):
+        self.fen = fen
+
+    def first_time(self, name):
+        marker = os.path.join(MARKER_DIR, name)
+        if os.path.exists(marker):
+            return False
+        open(marker, "w").close()
+        return True
+
+    def get_best_move(self):
+        kind, _, name = self.fen.partition(":")
+        if kind == "fail":
+            raise RuntimeError("stub engine failure")
+        if kind == "flaky" and self.first_time(name):
+            raise RuntimeError("stub engine failed once")
+        if kind == "hang" and self.first_time(name):
+            time.sleep(LEASE_TIMEOUT + 2)
+        time.sleep(0.05)
+        return "e2e4"
+
+    def get_evaluation(self):
+        # The pid shows which worker process ran the search
+        return {"type": "cp", "value": os.getpid()}
+
+
+def run_stub_worker(address):
+    engine_worker.Stockfish = StubEngine
+    engine_worker.ENGINE_BROKER_ADDRESS = address
+    engine_worker.HEARTBEAT_INTERVAL = 0.5
+    engine_worker.RECONNECT_DELAY = 0.5
+    sys.stdout = open(os.devnull, "w")
+    engine_worker.main()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def search(address, fen):
+    """Run one search and return (result, error, seconds taken)"""
+    started = time.monotonic()
+    try:
+        result = broker.request_engine_search(address, {"fen": fen, "depth": 1})
+        return result, None, time.monotonic() - started
+    except RuntimeError as e:
+        return None, str(e), time.monotonic() - started
+
+
+def search_many(address, fens):
+    results = [None] * len(fens)
+
+    def run(i):
+        results[i] = search(address, fens[i])
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(fens))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def register_raw_worker(address, worker_id):
+    sock = socket.create_connection(broker.parse_address(address))
+    broker.send_message(sock, {"op": "register", "worker_id": worker_id})
+    return sock
+
+
+def main():
+    broker.LEASE_TIMEOUT = LEASE_TIMEOUT
+    broker.HEARTBEAT_INTERVAL = 0.5
+    port = free_port()
+    address = f"127.0.0.1:{port}"
+    engine_broker = broker.Broker()
+    threading.Thread(target=broker.serve, args=("127.0.0.1", port, engine_broker), daemon=True).start()
+    time.sleep(0.3)
+
+    failures = []
+
+    def check(name, passed, detail=""):
+        print(f"{'✅' if passed else '❌'} {name}{f' ({detail})' if detail else ''}")
+        if not passed:
+            failures.append(name)
+
+    def worker_count():
+        with engine_broker.lock:
+            return len(engine_broker.workers)
+
+    result, error, seconds = search(address, "start")
+    check("search fails fast with no workers", error is not None and seconds < 1, error)
+
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=run_stub_worker, args=(address,), daemon=True) for _ in range(WORKER_COUNT)]
+    for process in workers:
+        process.start()
+    check(f"{WORKER_COUNT} workers register", wait_for(lambda: worker_count() == WORKER_COUNT))
+
+    results = search_many(address, [f"position-{i}" for i in range(40)])
+    served_by = {r[0]["evaluation"]["value"] for r in results if r[0]}
+    check("40 concurrent searches succeed", all(r[1] is None for r in results))
+    check("searches spread across workers", len(served_by) > 1, f"{len(served_by)} workers used")
+
+    result, error, seconds = search(address, "flaky:requeue")
+    check("failed search is requeued and succeeds", error is None, error)
+    result, error, seconds = search(address, "fail")
+    check("search that always fails errors after retries", error is not None and "attempts" in error, error)
+
+    result, error, seconds = search(address, "hang:lease")
+    check("search that overruns its lease is requeued", error is None and LEASE_TIMEOUT <= seconds < LEASE_TIMEOUT + 2,
+          f"{seconds:.1f}s")
+    check("dropped worker reconnects", wait_for(lambda: worker_count() == WORKER_COUNT))
+
+    for process in workers:
+        process.terminate()
+    check("broker notices workers leaving", wait_for(lambda: worker_count() == 0))
+    result, error, seconds = search(address, "start")
+    check("search fails fast after the last worker leaves", error is not None and seconds < 1, error)
+
+    # A stale connection closing must not remove the same id's new registration
+    old = register_raw_worker(address, "w0")
+    new = register_raw_worker(address, "w0")
+    broker.send_message(new, {"op": "ready"})
+    time.sleep(0.2)
+    broker.close_connection(old)
+    time.sleep(0.2)
+    pending = []
+    thread = threading.Thread(target=lambda: pending.append(search(address, "start")))
+    thread.start()
+    new.settimeout(5)
+    messages = broker.read_messages(new)
+    message = next(messages, None)
+    if message is not None and message.get("op") == "job":
+        broker.send_message(new, {"op": "done", "job_id": message["job_id"], "result": {"best_move": "e2e4"}})
+    thread.join()
+    check("re-registered worker survives its old connection closing",
+          message is not None and pending and pending[0][1] is None)
+
+    # While a worker is connected, queued jobs wait for it instead of failing
+    busy = register_raw_worker(address, "w1")
+    broker.send_message(busy, {"op": "ready"})
+    broker.close_connection(new)
+    time.sleep(0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(search(address, "start"))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    busy.settimeout(5)
+    messages = broker.read_messages(busy)
+    for _ in range(2):
+        message = next(messages)
+        time.sleep(1)
+        broker.send_message(busy, {"op": "done", "job_id": message["job_id"], "result": {"best_move": "e2e4"}})
+        broker.send_message(busy, {"op": "ready"})
+    for thread in threads:
+        thread.join()
+    check("queued searches wait for a busy worker", len(results) == 2 and all(r[1] is None for r in results))
+
+    # Jobs still queued when the last worker disconnects fail right away
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(search(address, "start"))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)
+    broker.close_connection(busy)
+    for thread in threads:
+        thread.join()
+    check("queued searches fail fast when the last worker leaves",
+          len(results) == 2 and all(r[1] is not None and r[2] < 2 for r in results))
+
+    shutil.rmtree(MARKER_DIR, ignore_errors=True)
+    print(f"\n{len(failures)} check(s) failed" if failures else "\nAll checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
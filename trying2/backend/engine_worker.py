@@ -0,0 +1,111 @@
+"""Standalone Stockfish worker that pulls searches from the engine broker.
+
+Run one process per core you want to give to analysis, on this machine or any
+other that can reach the broker:
+
+    ENGINE_BROKER_ADDRESS=127.0.0.1:5555 python engine_worker.py
+"""
+import os
+import platform
+import socket
+import threading
+import time
+import uuid
+
+from stockfish import Stockfish
+
+from broker import HEARTBEAT_INTERVAL, parse_address, read_messages, send_message
+
+ENGINE_BROKER_ADDRESS = os.environ.get("ENGINE_BROKER_ADDRESS", "127.0.0.1:5555")
+RECONNECT_DELAY = 3
+
+
+def default_stockfish_path():
+    if platform.system() == "Windows":
+        return "./stockfish/stockfish_17.1.exe"
+    return "stockfish"
+
+
+def search_position(engine, fen, depth, multipv=1, evaluate=True):
+    """Run one search on a Stockfish instance.
+
+    With multipv > 1 the top moves are returned instead of a single evaluation,
+    and evaluate=False skips the evaluation when only the best move is needed.
+    """
+    engine.set_depth(depth)
+    engine.set_fen_position(fen)
+    if multipv > 1:
+        return {"top_moves": engine.get_top_moves(multipv)}
+    result = {"best_move": engine.get_best_move()}
+    if evaluate:
+        result["evaluation"] = engine.get_evaluation()
+    return result
+
+
+def send_heartbeats(sock, send_lock, stop):
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            send_message(sock, {"op": "heartbeat"}, send_lock)
+        except OSError:
+            return
+
+
+def run_worker(stockfish_path, worker_id):
+    """Serve jobs over one broker connection until it drops.
+
+    Every connection starts a fresh engine and registers under its own id, so
+    a worker the broker dropped for a hung search comes back clean and is never
+    confused with its previous connection.
+    """
+    connection_id = f"{worker_id}-{uuid.uuid4().hex[:6]}"
+    print(f"Initializing Stockfish with path: {stockfish_path}")
+    engine = Stockfish(path=stockfish_path)
+    sock = socket.create_connection(parse_address(ENGINE_BROKER_ADDRESS))
+    send_lock = threading.Lock()
+    stop = threading.Event()
+    threading.Thread(target=send_heartbeats, args=(sock, send_lock, stop), daemon=True).start()
+
+    try:
+        send_message(sock, {"op": "register", "worker_id": connection_id}, send_lock)
+        send_message(sock, {"op": "ready"}, send_lock)
+        print(f"Engine worker {connection_id} connected to {ENGINE_BROKER_ADDRESS}")
+
+        for message in read_messages(sock):
+            if message.get("op") == "error":
+                print(f"Broker error: {message.get('error')}")
+                return
+            if message.get("op") != "job":
+                continue
+
+            job = message["job"]
+            try:
+                result = search_position(engine, job["fen"], job["depth"],
+                                         job.get("multipv", 1), job.get("evaluate", True))
+            except Exception as e:
+                print(f"Search failed for {job.get('fen')}: {e}")
+                send_message(sock, {"op": "failed", "job_id": message["job_id"], "error": str(e)}, send_lock)
+                # The engine process may have died with the search, start a fresh one
+                engine = Stockfish(path=stockfish_path)
+            else:
+                send_message(sock, {"op": "done", "job_id": message["job_id"], "result": result}, send_lock)
+            send_message(sock, {"op": "ready"}, send_lock)
+    finally:
+        stop.set()
+        sock.close()
+
+
+def main():
+    stockfish_path = os.environ.get("STOCKFISH_PATH", default_stockfish_path())
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+
+    while True:
+        try:
+            run_worker(stockfish_path, worker_id)
+            print("Broker closed the connection")
+        except OSError as e:
+            print(f"Worker connection to {ENGINE_BROKER_ADDRESS} failed: {e}")
+        time.sleep(RECONNECT_DELAY)
+
+
+if __name__ == '__main__':
+    main()
@@ -250,8 +250,8 @@ function App() {
 
     try {
       setLoading(true);
-      const response = await axios.post(`${API_URL}/analyze_pgn`, {
-        pgn: pgn,
+      const response = await axios.post(`${API_URL}/analyze_pgn`, pgn, {
+        headers: { "Content-Type": "application/x-chess-pgn" },
       });
 
       const newGame = new Chess();